@@ -1,12 +1,11 @@
-import json
-from typing import Self
+from typing import Iterator, Self
 
 from absl import flags, logging
 from influxdb_client import InfluxDBClient
-from jsonschema import Draft202012Validator
 from tenacity import before_sleep_log, retry, stop_after_attempt, wait_fixed
 
 from common.bucketinfo import BucketInfo
+from common.flagutil import value_or_default
 
 from .timestamp import Timestamp
 from .timestamprange import TimestampRange
@@ -26,21 +25,70 @@ _FLUX_QUERY = flags.DEFINE_multi_string(
     'Use --verbosity=1 to preview the assembled queries.',
 )
 
+_CONNECTION_POOL_SIZE = flags.DEFINE_integer(
+    name='connection_pool_size',
+    default=10,
+    lower_bound=1,
+    help='Max size of the HTTP connection pool shared by the clients. '
+    'Set the value to at least "workers" so concurrent queries do not queue on the pool.',
+)
+
+_VALIDATE_RESPONSES = flags.DEFINE_bool(
+    name='validate_responses',
+    default=False,
+    help='Controls if the query responses are validated against JSON schemas. '
+    'The steady-state responses are trivially either empty or one-row-one-int, '
+    'so validation is skipped by default to save a schema walk per query.',
+)
+
 
 class BucketClient:
+  _IS_EMPTY_TAIL = ' |> '.join([
+      'last()',
+      'map(fn: (r) => ({_value: int(v: r["_time"])}))',
+      'count()',
+  ])
+  _MIN_TIMESTAMP_TAIL = ' |> '.join([
+      'first()',
+      'map(fn: (r) => ({_value: int(v: r["_time"])}))',
+      'min()',
+  ])
+  _MAX_TIMESTAMP_TAIL = ' |> '.join([
+      'last()',
+      'map(fn: (r) => ({_value: int(v: r["_time"])}))',
+      'max()',
+  ])
+  _TIME_BOUNDS_TAILS = (
+      ' |> '.join([
+          'first()',
+          'map(fn: (r) => ({_field: "min", _value: int(v: r["_time"])}))',
+          'min()',
+      ]),
+      ' |> '.join([
+          'last()',
+          'map(fn: (r) => ({_field: "max", _value: int(v: r["_time"])}))',
+          'max()',
+      ]),
+  )
 
   def __init__(self, bucket_info: BucketInfo) -> None:
-    self._DRY_RUN = _DRY_RUN.value if _DRY_RUN.present else _DRY_RUN.default
-    self._FLUX_QUERY = _FLUX_QUERY.value if _FLUX_QUERY.present else _FLUX_QUERY.default
+    self._DRY_RUN = value_or_default(_DRY_RUN)
+    self._FLUX_QUERY = value_or_default(_FLUX_QUERY)
+    self._CONNECTION_POOL_SIZE = value_or_default(_CONNECTION_POOL_SIZE)
+    self._VALIDATE_RESPONSES = value_or_default(_VALIDATE_RESPONSES)
 
     self._bucket_info = bucket_info
+    self._from_bucket = f'from(bucket: "{bucket_info.bucket}")'
+    self._copy_tail: str | None = None
+    self._copy_tail_target: BucketInfo | None = None
 
   def __enter__(self) -> Self:
     self._client = InfluxDBClient(url=self._bucket_info.server_url,
                                   token=self._bucket_info.token,
                                   org=self._bucket_info.organization,
                                   timeout=60_000,
-                                  enable_gzip=True)
+                                  enable_gzip=True,
+                                  connection_pool_maxsize=self._CONNECTION_POOL_SIZE)
     self._query_api = self._client.query_api()
     return self
 
@@ -52,92 +100,124 @@ class BucketClient:
       wait=wait_fixed(5),
       stop=stop_after_attempt(5),
       reraise=True)
-  def execute_query(self, ts_range: TimestampRange, query_lines: list[str]) -> list[dict]:
-    query = ' |> '.join([
-        f'from(bucket: "{self._bucket_info.bucket}")',
-        str(ts_range),
-        *query_lines,
-        'yield()',
-    ])
+  def execute_query(self, ts_range: TimestampRange, query_lines: list[str] | str) -> list[dict]:
+    tail = query_lines if isinstance(query_lines, str) else ' |> '.join(query_lines)
+    query = f'{self._from_bucket} |> {ts_range} |> {tail} |> yield()'
     logging.debug(f'{query=}')
 
-    tables = json.loads(self._query_api.query(query).to_json())
-    _LIST_OF_DICTS_VALIDATOR.validate(tables)
+    tables = [record.values for table in self._query_api.query(query) for record in table.records]
+    if self._VALIDATE_RESPONSES:
+      _validate_list_of_dicts(tables)
     return tables
 
+  def execute_query_stream(self, ts_range: TimestampRange, query_lines: list[str] | str) -> Iterator[dict]:
+    tail = query_lines if isinstance(query_lines, str) else ' |> '.join(query_lines)
+    query = f'{self._from_bucket} |> {ts_range} |> {tail} |> yield()'
+    logging.debug(f'{query=}')
+
+    # query_stream() yields the records lazily, keeping memory flat regardless of the result size.
+    for record in self._query_api.query_stream(query):
+      yield record.values
+
   def is_emtpy(self) -> bool:
-    query_lines = [
-        'last()',
-        'map(fn: (r) => ({_value: int(v: r["_time"])}))',
-        'count()',
-    ]
-    tables = self.execute_query(TimestampRange.ETERNITY, query_lines)
+    tables = self.execute_query(TimestampRange.ETERNITY, self._IS_EMPTY_TAIL)
     return len(tables) == 0
 
   def get_min_timestamp(self) -> Timestamp:
-    query_lines = [
-        'first()',
-        'map(fn: (r) => ({_value: int(v: r["_time"])}))',
-        'min()',
-    ]
-    tables = self.execute_query(TimestampRange.ETERNITY, query_lines)
-    _SINGLE_INT_VALUE_VALIDATOR.validate(tables)
+    tables = self.execute_query(TimestampRange.ETERNITY, self._MIN_TIMESTAMP_TAIL)
+    if self._VALIDATE_RESPONSES:
+      _validate_single_int_value(tables)
 
     if len(tables) == 0:
       raise ValueError('no result was returned, is the bucket empty?')
     return Timestamp(int(tables[0]['_value']))
 
   def get_max_timestamp(self) -> Timestamp:
-    query_lines = [
-        'last()',
-        'map(fn: (r) => ({_value: int(v: r["_time"])}))',
-        'max()',
-    ]
-    tables = self.execute_query(TimestampRange.ETERNITY, query_lines)
-    _SINGLE_INT_VALUE_VALIDATOR.validate(tables)
+    tables = self.execute_query(TimestampRange.ETERNITY, self._MAX_TIMESTAMP_TAIL)
+    if self._VALIDATE_RESPONSES:
+      _validate_single_int_value(tables)
 
     if len(tables) == 0:
       raise ValueError('no result was returned, is the bucket empty?')
     return Timestamp(int(tables[0]['_value']))
 
+  @retry(
+      before_sleep=before_sleep_log(logger=logging, log_level=logging.WARNING),  # type: ignore
+      wait=wait_fixed(5),
+      stop=stop_after_attempt(5),
+      reraise=True)
+  def get_time_bounds(self) -> tuple[Timestamp, Timestamp] | None:
+    # One union query replaces the separate min and max queries, saving a round trip on startup.
+    branches = ', '.join(f'{self._from_bucket} |> {TimestampRange.ETERNITY} |> {tail}'
+                         for tail in self._TIME_BOUNDS_TAILS)
+    query = f'union(tables: [{branches}]) |> group(columns: ["_field"]) |> yield()'
+    logging.debug(f'{query=}')
+
+    tables = [record.values for table in self._query_api.query(query) for record in table.records]
+    if self._VALIDATE_RESPONSES:
+      _validate_list_of_dicts(tables)
+
+    if len(tables) == 0:
+      return None
+
+    bounds = {table['_field']: int(table['_value']) for table in tables}
+    return Timestamp(bounds['min']), Timestamp(bounds['max'])
+
+  def _get_copy_tail(self, target_bucket_info: BucketInfo) -> str:
+    if self._copy_tail is None or self._copy_tail_target != target_bucket_info:
+      query_lines = list(self._FLUX_QUERY)
+      if not self._DRY_RUN:
+        query_lines.append(target_bucket_info.to())
+      query_lines.extend([
+          'count()',
+          'group()',
+          'sum()',
+      ])
+      self._copy_tail = ' |> '.join(query_lines)
+      self._copy_tail_target = target_bucket_info
+
+    return self._copy_tail
+
   def copy_to_bucket(self, target_bucket_info: BucketInfo, ts_range: TimestampRange) -> int:
-    query_lines = list(self._FLUX_QUERY)
-    if not self._DRY_RUN:
-      query_lines.append(target_bucket_info.to())
-    query_lines.extend([
-        'count()',
-        'group()',
-        'sum()',
-    ])
-
-    tables = self.execute_query(ts_range, query_lines)
-    _SINGLE_INT_VALUE_VALIDATOR.validate(tables)
+    tables = self.execute_query(ts_range, self._get_copy_tail(target_bucket_info))
+    if self._VALIDATE_RESPONSES:
+      _validate_single_int_value(tables)
 
     if len(tables) == 0:
       return 0
     return int(tables[0]['_value'])
 
+  @retry(
+      before_sleep=before_sleep_log(logger=logging, log_level=logging.WARNING),  # type: ignore
+      wait=wait_fixed(5),
+      stop=stop_after_attempt(5),
+      reraise=True)
+  def copy_to_bucket_windows(self, target_bucket_info: BucketInfo, ts_ranges: list[TimestampRange]) -> int:
+    # union() requires at least 2 streams.
+    if len(ts_ranges) == 1:
+      return self.copy_to_bucket(target_bucket_info, ts_ranges[0])
+
+    tail = self._get_copy_tail(target_bucket_info)
+    branches = ', '.join(f'{self._from_bucket} |> {ts_range} |> {tail}' for ts_range in ts_ranges)
+    query = f'union(tables: [{branches}]) |> group() |> sum() |> yield()'
+    logging.debug(f'{query=}')
+
+    tables = [record.values for table in self._query_api.query(query) for record in table.records]
+    if self._VALIDATE_RESPONSES:
+      _validate_single_int_value(tables)
+
+    if len(tables) == 0:
+      return 0
+    return int(tables[0]['_value'])
+
+
+# The expected shapes are trivial, so a few isinstance checks replace a full schema walk.
+def _validate_list_of_dicts(tables: list[dict]) -> None:
+  if not (isinstance(tables, list) and all(isinstance(table, dict) for table in tables)):
+    raise ValueError(f'expected a list of dicts, got {tables!r}')
+
 
-_LIST_OF_DICTS_VALIDATOR = Draft202012Validator({
-    'type': 'array',
-    'items': {
-        'type': 'object'
-    },
-})
-Draft202012Validator.check_schema(_LIST_OF_DICTS_VALIDATOR.schema)
-
-_SINGLE_INT_VALUE_VALIDATOR = Draft202012Validator({
-    'type': 'array',
-    'minItems': 0,
-    'maxItems': 1,
-    'items': {
-        'type': 'object',
-        'properties': {
-            '_value': {
-                'type': 'integer'
-            }
-        },
-        'required': ['_value']
-    },
-})
-Draft202012Validator.check_schema(_SINGLE_INT_VALUE_VALIDATOR.schema)
+def _validate_single_int_value(tables: list[dict]) -> None:
+  if not (isinstance(tables, list) and len(tables) <= 1 and
+          (len(tables) == 0 or (isinstance(tables[0], dict) and isinstance(tables[0].get('_value'), int)))):
+    raise ValueError(f'expected at most 1 dict with an int "_value", got {tables!r}')
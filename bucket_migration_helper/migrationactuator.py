@@ -1,8 +1,14 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
 from threading import Event
+from typing import Iterator
 
 from absl import flags, logging
 
 from common.bucketinfo import BucketInfo
+from common.flagutil import value_or_default
 
 from .bucketclient import BucketClient
 from .duration import Duration
@@ -80,22 +86,52 @@ _TIME_RANGE_INCREMENT = flags.DEFINE_string(
     help='Time range increments between each query. '
     'Reduce the increment if the query times out.',
 )
+_ADAPTIVE_INCREMENT = flags.DEFINE_bool(
+    name='adaptive_increment',
+    default=False,
+    help='Adapts the time range increment to the number of records each query copies. '
+    'The increment halves after a dense query and doubles back after a sparse one, '
+    'capped at "time_range_increment". '
+    'Only used when "workers" and "windows_per_query" are 1.',
+)
+_WORKERS = flags.DEFINE_integer(
+    name='workers',
+    default=1,
+    lower_bound=1,
+    help='Number of copy queries to keep in flight at the same time. '
+    'Each worker opens its own connection to the source bucket. '
+    'Increase the value to hide the query round-trip time.',
+)
+_WINDOWS_PER_QUERY = flags.DEFINE_integer(
+    name='windows_per_query',
+    default=1,
+    lower_bound=1,
+    help='Number of time range windows to batch into a single Flux query via union(). '
+    'Increase the value to save round trips, reduce it if the query times out.',
+)
 
 
 class MigrationActuator:
+  # Result sizes that trigger resizing the adaptive increment.
+  _ADAPTIVE_LOW_WATER = 1_000
+  _ADAPTIVE_HIGH_WATER = 100_000
 
   def __init__(self) -> None:
-    self._SOURCE_SERVER_URL = _SOURCE_SERVER_URL.value if _SOURCE_SERVER_URL.present else _SOURCE_SERVER_URL.default
-    self._SOURCE_ORG = _SOURCE_ORG.value if _SOURCE_ORG.present else _SOURCE_ORG.default
-    self._SOURCE_BUCKET = _SOURCE_BUCKET.value if _SOURCE_BUCKET.present else _SOURCE_BUCKET.default
-    self._SOURCE_TOKEN = _SOURCE_TOKEN.value if _SOURCE_TOKEN.present else _SOURCE_TOKEN.default
-    self._TARGET_SERVER_URL = _TARGET_SERVER_URL.value if _TARGET_SERVER_URL.present else _TARGET_SERVER_URL.default
-    self._TARGET_ORG = _TARGET_ORG.value if _TARGET_ORG.present else _TARGET_ORG.default
-    self._TARGET_BUCKET = _TARGET_BUCKET.value if _TARGET_BUCKET.present else _TARGET_BUCKET.default
-    self._TARGET_TOKEN = _TARGET_TOKEN.value if _TARGET_TOKEN.present else _TARGET_TOKEN.default
-    self._TIME_RANGE_START = _TIME_RANGE_START.value if _TIME_RANGE_START.present else _TIME_RANGE_START.default
-    self._TIME_RANGE_STOP = _TIME_RANGE_STOP.value if _TIME_RANGE_STOP.present else _TIME_RANGE_STOP.default
-    self._TIME_RANGE_INCREMENT = _TIME_RANGE_INCREMENT.value if _TIME_RANGE_INCREMENT.present else _TIME_RANGE_INCREMENT.default
+    self._SOURCE_SERVER_URL = value_or_default(_SOURCE_SERVER_URL)
+    self._SOURCE_ORG = value_or_default(_SOURCE_ORG)
+    self._SOURCE_BUCKET = value_or_default(_SOURCE_BUCKET)
+    self._SOURCE_TOKEN = value_or_default(_SOURCE_TOKEN)
+    self._TARGET_SERVER_URL = value_or_default(_TARGET_SERVER_URL)
+    self._TARGET_ORG = value_or_default(_TARGET_ORG)
+    self._TARGET_BUCKET = value_or_default(_TARGET_BUCKET)
+    self._TARGET_TOKEN = value_or_default(_TARGET_TOKEN)
+    self._TIME_RANGE_START = value_or_default(_TIME_RANGE_START)
+    self._TIME_RANGE_STOP = value_or_default(_TIME_RANGE_STOP)
+    self._TIME_RANGE_INCREMENT = value_or_default(_TIME_RANGE_INCREMENT)
+    self._ADAPTIVE_INCREMENT = value_or_default(_ADAPTIVE_INCREMENT)
+    self._WORKERS = value_or_default(_WORKERS)
+    self._WINDOWS_PER_QUERY = value_or_default(_WINDOWS_PER_QUERY)
+    self._duration = Duration.build(self._TIME_RANGE_INCREMENT)
 
   def run(self, stop_event: Event) -> None:
     soruce_bucket_info = BucketInfo(server_url=self._SOURCE_SERVER_URL,
@@ -106,18 +142,22 @@ class MigrationActuator:
                                     organization=self._TARGET_ORG,
                                     bucket=self._TARGET_BUCKET,
                                     token=self._TARGET_TOKEN)
-    duration = Duration.build(self._TIME_RANGE_INCREMENT)
 
     with BucketClient(soruce_bucket_info) as client:
+      if self._TIME_RANGE_START is None or self._TIME_RANGE_STOP is None:
+        bounds = client.get_time_bounds()
+        if bounds is None:
+          raise ValueError('no result was returned, is the bucket empty?')
+
       if self._TIME_RANGE_START is not None:
         start = Timestamp.build(self._TIME_RANGE_START)
       else:
-        start = client.get_min_timestamp()
+        start = bounds[0]
 
       if self._TIME_RANGE_STOP is not None:
         stop = Timestamp.build(self._TIME_RANGE_STOP)
       else:
-        stop = client.get_max_timestamp()
+        stop = bounds[1]
         # +1ns to include the record with the last timestamp, since 'stop' is exclusive.
         try:
           stop += Duration(1)
@@ -125,21 +165,88 @@ class MigrationActuator:
           pass
 
       ts_range = TimestampRange(start, stop)
-      duration = Duration.build(self._TIME_RANGE_INCREMENT)
-      iterator = TimestampRangeIterator(ts_range, duration)
+      iterator = TimestampRangeIterator(ts_range, self._duration)
 
       logging.info(f'Iterating from {ts_range.start} ({ts_range.start.instant_ns}), '
                    f'to {ts_range.stop} ({ts_range.stop.instant_ns}), '
-                   f'interval {duration}')
+                   f'interval {self._duration}')
 
-      for i, current_range in enumerate(iterator):
+      if self._ADAPTIVE_INCREMENT and self._WORKERS == 1 and self._WINDOWS_PER_QUERY == 1:
+        self._copy_adaptive(client, target_bucket_info, ts_range, stop_event)
+        return
+
+      if self._WORKERS > 1:
+        self._copy_with_workers(soruce_bucket_info, target_bucket_info, iterator, stop_event)
+        return
+
+      for i, ts_ranges in enumerate(self._chunk_ranges(iterator)):
         if stop_event.is_set():
           break
 
-        logging.info(f'{i} of {iterator.length()} iterations, '
-                     f'from {current_range.start} ({current_range.start.instant_ns}), '
-                     f'to {current_range.stop} ({current_range.stop.instant_ns})')
+        logging.info(f'{i * self._WINDOWS_PER_QUERY} of {iterator.length()} iterations, '
+                     f'from {ts_ranges[0].start} ({ts_ranges[0].start.instant_ns}), '
+                     f'to {ts_ranges[-1].stop} ({ts_ranges[-1].stop.instant_ns})')
 
-        record_count = client.copy_to_bucket(target_bucket_info, current_range)
+        if len(ts_ranges) == 1:
+          record_count = client.copy_to_bucket(target_bucket_info, ts_ranges[0])
+        else:
+          record_count = client.copy_to_bucket_windows(target_bucket_info, ts_ranges)
 
         logging.info(f'Copied {record_count} records')
+
+  def _copy_adaptive(self, client: BucketClient, target_bucket_info: BucketInfo, ts_range: TimestampRange,
+                     stop_event: Event) -> None:
+    # The flag value is the ceiling. Sparse regions double the increment back
+    # toward it and dense regions halve away from it, keeping each query's
+    # result size steady instead of oscillating between tiny and huge queries.
+    max_increment_ns = self._duration.duration_ns
+    increment_ns = max_increment_ns
+    start = ts_range.start
+
+    while start < ts_range.stop and not stop_event.is_set():
+      # Both bounds are clamped to ts_range.stop, which is already validated.
+      stop = Timestamp._unchecked(min(start.instant_ns + increment_ns, ts_range.stop.instant_ns))
+      sub_range = TimestampRange(start, stop)
+
+      logging.info(f'Copying from {sub_range.start} ({sub_range.start.instant_ns}), '
+                   f'to {sub_range.stop} ({sub_range.stop.instant_ns})')
+      record_count = client.copy_to_bucket(target_bucket_info, sub_range)
+      logging.info(f'Copied {record_count} records')
+
+      if record_count < self._ADAPTIVE_LOW_WATER:
+        increment_ns = min(increment_ns * 2, max_increment_ns)
+      elif record_count > self._ADAPTIVE_HIGH_WATER:
+        increment_ns = max(increment_ns // 2, 1)
+      start = stop
+
+  def _chunk_ranges(self, iterator: TimestampRangeIterator) -> Iterator[list[TimestampRange]]:
+    while len(ts_ranges := list(islice(iterator, self._WINDOWS_PER_QUERY))) != 0:
+      yield ts_ranges
+
+  def _copy_with_workers(self, soruce_bucket_info: BucketInfo, target_bucket_info: BucketInfo,
+                         iterator: TimestampRangeIterator, stop_event: Event) -> None:
+    with ExitStack() as stack:
+      # InfluxDBClient queries are not thread-safe, so each worker gets its own client.
+      clients = [stack.enter_context(BucketClient(soruce_bucket_info)) for _ in range(self._WORKERS)]
+      executor = stack.enter_context(ThreadPoolExecutor(max_workers=self._WORKERS, thread_name_prefix='BucketClient'))
+      futures: deque[Future[int]] = deque()
+
+      for i, ts_ranges in enumerate(self._chunk_ranges(iterator)):
+        if stop_event.is_set():
+          break
+
+        while len(futures) >= self._WORKERS:
+          logging.info(f'Copied {futures.popleft().result()} records')
+
+        logging.info(f'{i * self._WINDOWS_PER_QUERY} of {iterator.length()} iterations, '
+                     f'from {ts_ranges[0].start} ({ts_ranges[0].start.instant_ns}), '
+                     f'to {ts_ranges[-1].stop} ({ts_ranges[-1].stop.instant_ns})')
+
+        client = clients[i % self._WORKERS]
+        if len(ts_ranges) == 1:
+          futures.append(executor.submit(client.copy_to_bucket, target_bucket_info, ts_ranges[0]))
+        else:
+          futures.append(executor.submit(client.copy_to_bucket_windows, target_bucket_info, ts_ranges))
+
+      while len(futures) != 0:
+        logging.info(f'Copied {futures.popleft().result()} records')
@@ -1,12 +1,24 @@
 import re
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from typing import ClassVar, Self, overload
 
 from .duration import Duration
 
+# %-formatting dispatches to a single C-level call, beating an f-string with many format specs.
+_STR_FORMAT = '%s.%09dZ'
 
-@dataclass(frozen=True, order=True)
+
+# The same few timestamps render over and over across query assembly, retries, and logging,
+# and Timestamp is immutable, so the rendered strings memoize safely.
+@lru_cache(maxsize=1024)
+def _format_instant(instant_ns: int) -> str:
+  seconds, nanoseconds = divmod(instant_ns, 10**9)
+  return _STR_FORMAT % (datetime.fromtimestamp(seconds).isoformat(), nanoseconds)
+
+
+@dataclass(frozen=True, order=True, slots=True)
 class Timestamp:
   instant_ns: int
 
@@ -23,10 +35,15 @@ class Timestamp:
       raise ValueError(f'value {self.instant_ns} out of range, '
                        f'expected to be in range [{self._NANOSECONDS_MIN}, {self._NANOSECONDS_MAX}]')
 
+  @classmethod
+  def _unchecked(cls, instant_ns: int) -> Self:
+    # Fast path for values already known to be in range, bypassing __post_init__.
+    timestamp = object.__new__(cls)
+    object.__setattr__(timestamp, 'instant_ns', instant_ns)
+    return timestamp
+
   def __str__(self) -> str:
-    iso_format = datetime.fromtimestamp(self.instant_ns // 10**9).isoformat()
-    nanoseconds = '{:09d}'.format(self.instant_ns % 10**9)
-    return iso_format + '.' + nanoseconds + 'Z'
+    return _format_instant(self.instant_ns)
 
   @overload
   def __sub__(self, other: Duration) -> Self:
@@ -48,34 +65,35 @@ class Timestamp:
       return self.__class__(self.instant_ns + other.duration_ns)
     return NotImplemented
 
-  def __eq__(self, other: object) -> bool:
-    if isinstance(other, int):
-      return self.instant_ns == other
-    if isinstance(other, Timestamp):
-      return self.instant_ns == other.instant_ns
-    return NotImplemented
-
   def __index__(self) -> int:
     return self.instant_ns
 
-  _REGEX: ClassVar[str] = (r'^'
-                           r'(?P<date>\d{4}-\d{2}-?\d{2}T?\d{2}:\d{2}:\d{2})'
-                           r'\.(?P<nanoseconds>\d{9})Z'
-                           r'$')
-  _PATTERN: ClassVar[re.Pattern[str]] = re.compile(_REGEX)
-  _STRPTIME_FORMAT: ClassVar[str] = '%Y-%m-%dT%H:%M:%S'
+  _REGEX: ClassVar[str] = (r'(?P<year>\d{4})-(?P<month>\d{2})-?(?P<day>\d{2})'
+                           r'T?(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})'
+                           r'\.(?P<nanoseconds>\d{9})Z')
+  # The grammar is pure ASCII, so re.ASCII keeps \d from consulting the Unicode tables.
+  _PATTERN: ClassVar[re.Pattern[str]] = re.compile(_REGEX, re.ASCII)
   _EPOCH_DATE: ClassVar[datetime] = datetime(1970, 1, 1)
 
   @classmethod
   def build(cls, s: str) -> Self:
-    try:
+    # Cheap dispatch between the two formats, avoiding the exception machinery of a failed int().
+    if (s[1:] if s[:1] in '+-' else s).isdecimal():
       return cls(int(s))
-    except ValueError:
-      pass
 
-    assert (match := cls._PATTERN.search(s)) is not None, f'unable to match regex {cls._REGEX}'
-    date = datetime.strptime(str(match['date']), cls._STRPTIME_FORMAT)
-    nanoseconds = int(match['nanoseconds'])
+    # The canonical RFC3339 form is fixed-width, so the fields slice straight out of the string.
+    # Looser forms with separators omitted still go through the regex.
+    if (len(s) == 30 and s[4] == '-' and s[7] == '-' and s[10] == 'T' and s[13] == ':' and s[16] == ':'
+        and s[19] == '.' and s[29] == 'Z'):
+      date = datetime(int(s[:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19]))
+      nanoseconds = int(s[20:29])
+    else:
+      # fullmatch() anchors both ends itself, replacing the ^...$ in the pattern.
+      assert (match := cls._PATTERN.fullmatch(s)) is not None, f'unable to match regex {cls._REGEX}'
+      # datetime() takes the matched fields directly, skipping a second pass through strptime().
+      date = datetime(int(match['year']), int(match['month']), int(match['day']), int(match['hour']),
+                      int(match['minute']), int(match['second']))
+      nanoseconds = int(match['nanoseconds'])
 
     seconds = int((date - cls._EPOCH_DATE).total_seconds())
 
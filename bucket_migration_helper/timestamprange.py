@@ -5,7 +5,7 @@ from .duration import Duration
 from .timestamp import Timestamp
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TimestampRange:
   ETERNITY: ClassVar[Self]
 
@@ -16,6 +16,14 @@ class TimestampRange:
     if not self.start < self.stop:
       raise ValueError(f'start timestamp {self.start} must be smaller than stop timestamp {self.stop}')
 
+  @classmethod
+  def _unchecked(cls, start: Timestamp, stop: Timestamp) -> Self:
+    # Fast path for ranges already known to be valid, bypassing __post_init__.
+    ts_range = object.__new__(cls)
+    object.__setattr__(ts_range, 'start', start)
+    object.__setattr__(ts_range, 'stop', stop)
+    return ts_range
+
   def __str__(self) -> str:
     return f'range(start: {self.start}, stop: {self.stop})'
 
@@ -1,7 +1,7 @@
-import math
 from typing import Iterator, Self
 
 from .duration import Duration
+from .timestamp import Timestamp
 from .timestamprange import TimestampRange
 
 
@@ -14,7 +14,15 @@ class TimestampRangeIterator(Iterator[TimestampRange]):
     self.ts_range = ts_range
     self.step = step
     self._i = 0
-    self._n = math.ceil(self.ts_range.duraton() / self.step)
+
+    # Stepping in raw nanoseconds keeps the per-iteration arithmetic on plain ints.
+    self._start_ns = ts_range.start.instant_ns
+    self._stop_ns = ts_range.stop.instant_ns
+    self._step_ns = step.duration_ns
+
+    # Exact integer ceiling division. Going through float loses precision for
+    # durations near 2**63 ns and could undercount the windows.
+    self._n = -(-(self._stop_ns - self._start_ns) // self._step_ns)
 
   def __iter__(self) -> Self:
     return self
@@ -23,14 +31,11 @@ class TimestampRangeIterator(Iterator[TimestampRange]):
     if self._i == self._n:
       raise StopIteration()
 
-    start = self.ts_range.start + self.step * self._i
-    try:
-      stop = min(start + self.step, self.ts_range.stop)
-    except ValueError:
-      stop = self.ts_range.stop
+    start_ns = self._start_ns + self._step_ns * self._i
+    stop_ns = min(start_ns + self._step_ns, self._stop_ns)
 
     self._i += 1
-    return TimestampRange(start, stop)
+    return TimestampRange._unchecked(Timestamp._unchecked(start_ns), Timestamp._unchecked(stop_ns))
 
   def length(self) -> int:
     return self._n
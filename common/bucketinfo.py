@@ -1,12 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class BucketInfo:
   server_url: str
   organization: str
   bucket: str
   token: str
+  _to_clause: str = field(init=False, repr=False, compare=False)
 
   def __post_init__(self) -> None:
     assert self.server_url != '', 'expected "server_url" to be non-empty'
@@ -14,5 +15,10 @@ class BucketInfo:
     assert self.bucket != '', 'expected "bucket" to be non-empty'
     assert self.token != '', 'expected "token" to be non-empty'
 
+    # The fields never change after construction, so the to() fragment renders once
+    # here instead of on every copy query.
+    self._to_clause = (f'to(host: "{self.server_url}", org: "{self.organization}", '
+                       f'bucket: "{self.bucket}", token: "{self.token}")')
+
   def to(self) -> str:
-    return f'to(host: "{self.server_url}", org: "{self.organization}", bucket: "{self.bucket}", token: "{self.token}")'
+    return self._to_clause
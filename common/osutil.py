@@ -0,0 +1,19 @@
+import os
+from threading import Lock
+
+# makedirs(exist_ok=True) still stats the path on every call; remembering the
+# directories already created keeps repeat entries to a set lookup.
+_ENSURED_DIRS: set[str] = set()
+_LOCK = Lock()
+
+
+def ensure_parent_dir(path: str) -> None:
+  directory = os.path.dirname(path)
+  # A bare filename lives in the working directory, which always exists.
+  if directory == '' or directory in _ENSURED_DIRS:
+    return
+
+  with _LOCK:
+    if directory not in _ENSURED_DIRS:
+      os.makedirs(directory, exist_ok=True)
+      _ENSURED_DIRS.add(directory)
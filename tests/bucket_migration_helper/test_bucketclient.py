@@ -1,3 +1,4 @@
+from functools import lru_cache
 from unittest.mock import Mock, patch
 
 from absl import logging
@@ -5,21 +6,54 @@ from absl.logging.converter import absl_to_standard
 from absl.testing import flagsaver, parameterized
 from influxdb_client import InfluxDBClient, QueryApi
 from influxdb_client.client.flux_table import FluxRecord, FluxTable, TableList
-from jsonschema import ValidationError
 from tenacity import stop_after_attempt, wait_none
 
-from bucket_migration_helper.bucketclient import _DRY_RUN, _FLUX_QUERY, BucketClient
+from bucket_migration_helper.bucketclient import _DRY_RUN, _FLUX_QUERY, _VALIDATE_RESPONSES, BucketClient
 from bucket_migration_helper.timestamp import Timestamp
 from bucket_migration_helper.timestamprange import TimestampRange
 from common.bucketinfo import BucketInfo
 
 MOCK_QUERY = Mock()
+MOCK_QUERY_STREAM = Mock()
+
+
+# The same few fixtures are requested across most tests, and the tests only read
+# them, so each distinct table list is built once and shared.
+@lru_cache(maxsize=None)
+def create_table_list_of(*values: int) -> TableList:
+  table_list = TableList()
+
+  for i, value in enumerate(values):
+    record = FluxRecord('record')
+    record['result'] = '_result'
+    record['table'] = i
+    record['_value'] = value
+
+    table = FluxTable()
+    table.records.append(record)
+    table_list.append(table)
+
+  return table_list
+
+
+@lru_cache(maxsize=None)
+def create_time_bounds_table_list(*bounds: tuple[str, int]) -> TableList:
+  table_list = TableList()
+
+  for i, (field, value) in enumerate(bounds):
+    record = FluxRecord('record')
+    record['result'] = '_result'
+    record['table'] = i
+    record['_field'] = field
+    record['_value'] = value
+
+    table = FluxTable()
+    table.records.append(record)
+    table_list.append(table)
+
+  return table_list
 
 
-@patch.object(InfluxDBClient, InfluxDBClient.query_api.__name__,
-              Mock(return_value=Mock(spec=QueryApi, query=MOCK_QUERY)))
-@patch.object(BucketClient.execute_query.retry, 'wait', wait_none())  # type: ignore
-@patch.object(BucketClient.execute_query.retry, 'stop', stop_after_attempt(3))  # type: ignore
 class TestBucketClient(parameterized.TestCase):
 
   SOURCE_BUCKET_INFO = BucketInfo(server_url='source-server-url',
@@ -31,29 +65,22 @@ class TestBucketClient(parameterized.TestCase):
                                   bucket='target-bucket',
                                   token='target-token')
 
-  def setUp(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([])
-    return super().setUp()
-
-  def tearDown(self) -> None:
-    MOCK_QUERY.reset_mock(return_value=True, side_effect=True)
-    return super().tearDown()
-
   @classmethod
-  def create_table_list_of(cls, values: list[int]) -> TableList:
-    table_list = TableList()
-
-    for i, value in enumerate(values):
-      record = FluxRecord('record')
-      record['result'] = '_result'
-      record['table'] = i
-      record['_value'] = value
-
-      table = FluxTable()
-      table.records.append(record)
-      table_list.append(table)
+  def setUpClass(cls):
+    super().setUpClass()
+    # Installing the patches once per class skips the patch enter/exit bookkeeping
+    # that class decorators repeat around every test method.
+    cls.enterClassContext(
+        patch.object(InfluxDBClient, InfluxDBClient.query_api.__name__,
+                     Mock(return_value=Mock(spec=QueryApi, query=MOCK_QUERY, query_stream=MOCK_QUERY_STREAM))))
+    cls.enterClassContext(patch.object(BucketClient.execute_query.retry, 'wait', wait_none()))  # type: ignore
+    cls.enterClassContext(patch.object(BucketClient.execute_query.retry, 'stop', stop_after_attempt(3)))  # type: ignore
 
-    return table_list
+  def setUp(self):
+    MOCK_QUERY.reset_mock(return_value=True, side_effect=True)
+    MOCK_QUERY_STREAM.reset_mock(return_value=True, side_effect=True)
+    MOCK_QUERY.return_value = create_table_list_of()
+    return super().setUp()
 
   @patch.object(InfluxDBClient, InfluxDBClient.close.__name__, Mock())
   def test_closesClientAtExit(self):
@@ -84,7 +111,7 @@ class TestBucketClient(parameterized.TestCase):
     ])
 
   def test_executeQuery_retriesAndLogs(self):
-    MOCK_QUERY.side_effect = [Exception('exception'), ValueError('value-error'), self.create_table_list_of([])]
+    MOCK_QUERY.side_effect = [Exception('exception'), ValueError('value-error'), create_table_list_of()]
 
     with self.assertLogs(logger='absl', level=absl_to_standard(logging.WARNING)) as logs:
       with BucketClient(self.SOURCE_BUCKET_INFO) as client:
@@ -103,12 +130,31 @@ class TestBucketClient(parameterized.TestCase):
         with BucketClient(self.SOURCE_BUCKET_INFO) as client:
           client.execute_query(TimestampRange.ETERNITY, ['query()', 'lines()'])
 
+  def test_executeQueryStream_yieldsRecordValues(self):
+    records = []
+    for value in [100, 200]:
+      record = FluxRecord('record')
+      record['_value'] = value
+      records.append(record)
+    MOCK_QUERY_STREAM.return_value = iter(records)
+
+    with BucketClient(self.SOURCE_BUCKET_INFO) as client:
+      values = list(client.execute_query_stream(TimestampRange.ETERNITY, ['query()', 'lines()']))
+
+    self.assertListEqual(values, [{'_value': 100}, {'_value': 200}])
+    MOCK_QUERY_STREAM.assert_called_once_with(
+        'from(bucket: "source-bucket")'
+        ' |> range(start: 1677-09-21T00:12:43.145224193Z, stop: 2262-04-11T23:47:16.854775807Z)'
+        ' |> query()'
+        ' |> lines()'
+        ' |> yield()')
+
   def test_isEmpty_emptyBucket_returnsTrue(self):
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
       self.assertTrue(client.is_emtpy())
 
   def test_isEmpty_nonEmptyBucket_returnsFalse(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([1])
+    MOCK_QUERY.return_value = create_table_list_of(1)
 
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
       self.assertFalse(client.is_emtpy())
@@ -118,15 +164,16 @@ class TestBucketClient(parameterized.TestCase):
       with BucketClient(self.SOURCE_BUCKET_INFO) as client:
         client.get_min_timestamp()
 
+  @flagsaver.as_parsed((_VALIDATE_RESPONSES, 'true'))
   def test_getMinTimestamp_invalidResult_raises(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([100, 200])
+    MOCK_QUERY.return_value = create_table_list_of(100, 200)
 
-    with self.assertRaisesRegex(ValidationError, "Failed validating 'maxItems' in schema"):
+    with self.assertRaisesRegex(ValueError, 'expected at most 1 dict'):
       with BucketClient(self.SOURCE_BUCKET_INFO) as client:
         client.get_min_timestamp()
 
   def test_getMinTimestamp_nonEmptyBucket_returnsTimestamp(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([100])
+    MOCK_QUERY.return_value = create_table_list_of(100)
 
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
       self.assertEqual(client.get_min_timestamp(), Timestamp(100))
@@ -136,51 +183,75 @@ class TestBucketClient(parameterized.TestCase):
       with BucketClient(self.SOURCE_BUCKET_INFO) as client:
         client.get_max_timestamp()
 
+  @flagsaver.as_parsed((_VALIDATE_RESPONSES, 'true'))
   def test_getMaxTimestamp_invalidResult_raises(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([100, 200])
+    MOCK_QUERY.return_value = create_table_list_of(100, 200)
 
-    with self.assertRaisesRegex(ValidationError, "Failed validating 'maxItems' in schema"):
+    with self.assertRaisesRegex(ValueError, 'expected at most 1 dict'):
       with BucketClient(self.SOURCE_BUCKET_INFO) as client:
         client.get_max_timestamp()
 
   def test_getMaxTimestamp_nonEmptyBucket_returnsTimestamp(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([100])
+    MOCK_QUERY.return_value = create_table_list_of(100)
 
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
       self.assertEqual(client.get_max_timestamp(), Timestamp(100))
 
-  def test_copyToBucket_dryRun_doesNotSendToTarget(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([5])
-
+  def test_getTimeBounds_emptyBucket_returnsNone(self):
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
-      client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
+      self.assertIsNone(client.get_time_bounds())
 
-    MOCK_QUERY.assert_called_once_with(
-        'from(bucket: "source-bucket")'
-        ' |> range(start: 1677-09-21T00:12:43.145224193Z, stop: 2262-04-11T23:47:16.854775807Z)'
-        ' |> count()'
-        ' |> group()'
-        ' |> sum()'
-        ' |> yield()')
+  def test_getTimeBounds_nonEmptyBucket_returnsTimestamps(self):
+    MOCK_QUERY.return_value = create_time_bounds_table_list(('min', 100), ('max', 200))
+
+    with BucketClient(self.SOURCE_BUCKET_INFO) as client:
+      self.assertEqual(client.get_time_bounds(), (Timestamp(100), Timestamp(200)))
 
-  @flagsaver.as_parsed((_DRY_RUN, 'false'))
-  def test_copyToBucket_wetRun_sendsToTarget(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([5])
+  def test_getTimeBounds_buildsUnionQuery(self):
+    MOCK_QUERY.return_value = create_time_bounds_table_list(('min', 100), ('max', 200))
 
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
-      client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
+      client.get_time_bounds()
 
     MOCK_QUERY.assert_called_once_with(
+        'union(tables: ['
         'from(bucket: "source-bucket")'
         ' |> range(start: 1677-09-21T00:12:43.145224193Z, stop: 2262-04-11T23:47:16.854775807Z)'
-        ' |> to(host: "target-server-url", org: "target-org", bucket: "target-bucket", token: "target-token")'
-        ' |> count()'
-        ' |> group()'
-        ' |> sum()'
-        ' |> yield()')
+        ' |> first()'
+        ' |> map(fn: (r) => ({_field: "min", _value: int(v: r["_time"])}))'
+        ' |> min()'
+        ', '
+        'from(bucket: "source-bucket")'
+        ' |> range(start: 1677-09-21T00:12:43.145224193Z, stop: 2262-04-11T23:47:16.854775807Z)'
+        ' |> last()'
+        ' |> map(fn: (r) => ({_field: "max", _value: int(v: r["_time"])}))'
+        ' |> max()'
+        ']) |> group(columns: ["_field"]) |> yield()')
+
+  # The expected queries share all of their fragments, so the dry-run and custom
+  # query line combinations fold into one parameterized case built by join.
+  ETERNITY_RANGE = 'range(start: 1677-09-21T00:12:43.145224193Z, stop: 2262-04-11T23:47:16.854775807Z)'
+  TO_TARGET = 'to(host: "target-server-url", org: "target-org", bucket: "target-bucket", token: "target-token")'
+
+  @parameterized.parameters(
+      (True, []),
+      (False, []),
+      (True, ['query1()', 'query2()']),
+      (False, ['query1()', 'query2()']),
+  )
+  def test_copyToBucket_buildsQueryFromFlags(self, dry_run: bool, flux_query: list[str]):
+    MOCK_QUERY.return_value = create_table_list_of(5)
+
+    with flagsaver.as_parsed((_DRY_RUN, str(dry_run)), (_FLUX_QUERY, flux_query)):
+      with BucketClient(self.SOURCE_BUCKET_INFO) as client:
+        client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
+
+    MOCK_QUERY.assert_called_once_with(' |> '.join(['from(bucket: "source-bucket")', self.ETERNITY_RANGE] +
+                                                   flux_query + ([] if dry_run else [self.TO_TARGET]) +
+                                                   ['count()', 'group()', 'sum()', 'yield()']))
 
   def test_copyToBucket_emptyRange_returns0(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([])
+    MOCK_QUERY.return_value = create_table_list_of()
 
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
       result = client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
@@ -188,47 +259,68 @@ class TestBucketClient(parameterized.TestCase):
     self.assertEqual(result, 0)
 
   def test_copyToBucket_nonEmptyRange_returnsRecordsCopied(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([5])
+    MOCK_QUERY.return_value = create_table_list_of(5)
 
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
       result = client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
 
     self.assertEqual(result, 5)
 
+  @flagsaver.as_parsed((_VALIDATE_RESPONSES, 'true'))
   def test_copyToBucket_invalidResult_raises(self):
-    MOCK_QUERY.return_value = self.create_table_list_of([100, 200])
+    MOCK_QUERY.return_value = create_table_list_of(100, 200)
 
-    with self.assertRaisesRegex(ValidationError, "Failed validating 'maxItems' in schema"):
+    with self.assertRaisesRegex(ValueError, 'expected at most 1 dict'):
       with BucketClient(self.SOURCE_BUCKET_INFO) as client:
         client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
 
-  @flagsaver.as_parsed((_FLUX_QUERY, ['query1()', 'query2()']))
-  def test_copyToBucket_customQueryLines_dryRun_addedToQuery(self):
+  def test_copyToBucketWindows_singleRange_usesPlainQuery(self):
+    MOCK_QUERY.return_value = create_table_list_of(5)
+
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
-      client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
+      result = client.copy_to_bucket_windows(self.TARGET_BUCKET_INFO, [TimestampRange.ETERNITY])
 
+    self.assertEqual(result, 5)
     MOCK_QUERY.assert_called_once_with(
         'from(bucket: "source-bucket")'
         ' |> range(start: 1677-09-21T00:12:43.145224193Z, stop: 2262-04-11T23:47:16.854775807Z)'
-        ' |> query1()'
-        ' |> query2()'
         ' |> count()'
         ' |> group()'
         ' |> sum()'
         ' |> yield()')
 
-  @flagsaver.as_parsed((_DRY_RUN, 'false'), (_FLUX_QUERY, ['query1()', 'query2()']))
-  def test_copyToBucket_customQueryLines_wetRun_addedToQuery(self):
+  def test_copyToBucketWindows_multipleRanges_buildsUnionQuery(self):
+    MOCK_QUERY.return_value = create_table_list_of(5)
+
     with BucketClient(self.SOURCE_BUCKET_INFO) as client:
-      client.copy_to_bucket(self.TARGET_BUCKET_INFO, TimestampRange.ETERNITY)
+      result = client.copy_to_bucket_windows(self.TARGET_BUCKET_INFO, [
+          TimestampRange(Timestamp(0), Timestamp(10)),
+          TimestampRange(Timestamp(10), Timestamp(20)),
+      ])
 
+    self.assertEqual(result, 5)
     MOCK_QUERY.assert_called_once_with(
+        'union(tables: ['
         'from(bucket: "source-bucket")'
-        ' |> range(start: 1677-09-21T00:12:43.145224193Z, stop: 2262-04-11T23:47:16.854775807Z)'
-        ' |> query1()'
-        ' |> query2()'
-        ' |> to(host: "target-server-url", org: "target-org", bucket: "target-bucket", token: "target-token")'
+        ' |> range(start: 1970-01-01T00:00:00.000000000Z, stop: 1970-01-01T00:00:00.000000010Z)'
         ' |> count()'
         ' |> group()'
         ' |> sum()'
-        ' |> yield()')
+        ', '
+        'from(bucket: "source-bucket")'
+        ' |> range(start: 1970-01-01T00:00:00.000000010Z, stop: 1970-01-01T00:00:00.000000020Z)'
+        ' |> count()'
+        ' |> group()'
+        ' |> sum()'
+        ']) |> group() |> sum() |> yield()')
+
+  def test_copyToBucketWindows_emptyResult_returns0(self):
+    MOCK_QUERY.return_value = create_table_list_of()
+
+    with BucketClient(self.SOURCE_BUCKET_INFO) as client:
+      result = client.copy_to_bucket_windows(self.TARGET_BUCKET_INFO, [
+          TimestampRange(Timestamp(0), Timestamp(10)),
+          TimestampRange(Timestamp(10), Timestamp(20)),
+      ])
+
+    self.assertEqual(result, 0)
